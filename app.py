@@ -1,8 +1,15 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, jsonify, flash, g
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.security import generate_password_hash, check_password_hash
-from models import db, Ingredient, Purchase, Usage, UnitMatrix, ShoppingEvent, User
-from datetime import datetime, date
+from models import db, Ingredient, Purchase, Usage, UnitMatrix, ShoppingEvent, User, MonthlyRollup
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import joinedload, lazyload, load_only, selectinload
+from datetime import datetime, date, timedelta
+from itertools import groupby
+from operator import attrgetter
+import click
 import os
 
 app = Flask(__name__)
@@ -24,9 +31,16 @@ login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 
+# Explicit KDF parameters (scrypt, N=2^15, r=8, p=1) so hashes don't change with Werkzeug's defaults
+PASSWORD_HASH_METHOD = 'scrypt:32768:8:1'
+
+# Checked against on unknown emails so login misses cost the same as real checks.
+# Built at import so the first miss in a worker isn't slower than a real check.
+DUMMY_PASSWORD_HASH = generate_password_hash('not-a-real-password', method=PASSWORD_HASH_METHOD)
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return db.session.get(User, int(user_id))
 
 # --- Auth Routes ---
 @app.route('/signup', methods=['GET', 'POST'])
@@ -44,7 +58,7 @@ def signup():
         new_user = User(
             username=username,
             email=email,
-            password_hash=generate_password_hash(password)
+            password_hash=generate_password_hash(password, method=PASSWORD_HASH_METHOD)
         )
         db.session.add(new_user)
         db.session.commit()
@@ -58,9 +72,12 @@ def signup():
 def login():
     if request.method == 'POST':
         email = request.form.get('email')
-        password = request.form.get('password')
+        password = request.form.get('password') or ''
         
         user = User.query.filter_by(email=email).first()
+        if not user:
+            # Still run the KDF to keep response time constant (no user enumeration by timing)
+            check_password_hash(DUMMY_PASSWORD_HASH, password)
         if not user or not check_password_hash(user.password_hash, password):
             flash('Please check your login details and try again.')
             return redirect(url_for('login'))
@@ -78,66 +95,179 @@ def logout():
 
 # --- Business Logic Helpers ---
 
-def calculate_fifo_cost(ingredient_id, needed_qty):
+def calculate_fifo_cost_batch(needs):
     """
-    Calculate cost for `needed_qty` using FIFO from Purchases.
-    Updates `remaining_quantity` in Purchase records.
-    Returns calculated cost.
+    Calculate costs using FIFO from Purchases.
+    `needs` is a list of (ingredient_id, needed_qty) pairs; the same ingredient may appear
+    more than once and is consumed in list order, exactly as sequential FIFO would.
+    All active purchases are fetched in one query and their `remaining_quantity` is updated
+    in memory; this does not commit, so callers must commit.
+    Returns a list of costs aligned with `needs`.
     """
-    ingredient = Ingredient.query.get(ingredient_id)
-    if not ingredient:
-        return 0.0
-
-    # Sort purchases by date (and expiry if available) to ensure FIFO
-    # We use purchase_date asc. If same day, maybe expiry?
+    # Line indexes per ingredient, in request order
+    lines_by_ingredient = {}
+    for i, (ing_id, _) in enumerate(needs):
+        lines_by_ingredient.setdefault(ing_id, []).append(i)
+    if not lines_by_ingredient:
+        return []
+
+    costs = [0.0] * len(needs)
+    remaining_ingredients = len(lines_by_ingredient)
+
+    # Sort purchases by date (and expiry if available) to ensure FIFO, per ingredient.
+    # Rows are streamed so we stop reading once every ingredient is filled; no_autoflush keeps
+    # the in-memory updates from being flushed mid-scan (they go out with the caller's commit).
+    # Rows are locked (FOR UPDATE) since the cost depends on the remaining quantity we read;
+    # the ingredient isn't needed, so skip its default joined load (and its row lock).
     purchases = Purchase.query.filter(
-        Purchase.ingredient_id == ingredient_id, 
+        Purchase.ingredient_id.in_(lines_by_ingredient.keys()),
         Purchase.remaining_quantity > 0
-    ).order_by(Purchase.purchase_date.asc(), Purchase.expiry_date.asc()).all()
+    ).options(lazyload(Purchase.ingredient)).order_by(
+        Purchase.ingredient_id, Purchase.purchase_date.asc(), Purchase.expiry_date.asc()
+    ).with_for_update().yield_per(16)
 
-    total_cost = 0.0
-    qty_to_fill = needed_qty
+    with db.session.no_autoflush:
+        for ing_id, batches in groupby(purchases, key=attrgetter('ingredient_id')):
+            lines = iter(lines_by_ingredient[ing_id])
+            line = next(lines)
+            qty_to_fill = needs[line][1]
 
-    for p in purchases:
-        if qty_to_fill <= 0:
-            break
-        
-        take = min(p.remaining_quantity, qty_to_fill)
-        cost_chunk = take * p.cost_per_unit
-        
-        # update purchase record
-        p.remaining_quantity -= take
-        
-        total_cost += cost_chunk
-        qty_to_fill -= take
-        
-    # Commit changes to purchases (inventory reduction)
-    db.session.commit()
-    return total_cost
+            for p in batches:
+                # One batch can cover several lines and one line can span several batches
+                while line is not None and p.remaining_quantity > 0:
+                    if qty_to_fill <= 0:
+                        line = next(lines, None)
+                        qty_to_fill = needs[line][1] if line is not None else 0
+                        continue
+
+                    take = min(p.remaining_quantity, qty_to_fill)
+                    cost_chunk = take * p.cost_per_unit
+
+                    # update purchase record
+                    p.remaining_quantity -= take
+
+                    costs[line] += cost_chunk
+                    qty_to_fill -= take
+
+                if line is None:
+                    break # This ingredient is filled; skip its later batches
+
+            # Once the last ingredient is done, stop instead of letting groupby drain its remaining rows
+            remaining_ingredients -= 1
+            if remaining_ingredients == 0:
+                break
+
+    return costs
+
+def get_unit_ratios():
+    """
+    Map of unit_name -> ratio_to_standard, loaded once and kept on `g` for the rest of the request.
+    Not cached across requests, since units can be renamed (see migrate_units.py) while workers keep running.
+    """
+    if 'unit_ratios' not in g:
+        g.unit_ratios = {u.unit_name: u.ratio_to_standard for u in UnitMatrix.query.all()}
+    return g.unit_ratios
+
+def month_key(d):
+    return d.strftime('%Y%m')
+
+def dialect_insert():
+    """`insert` construct with ON CONFLICT support for the configured database (Postgres or SQLite)."""
+    return postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+
+def bump_monthly_rollup(day, shopping=0.0, waste=0.0, usage=0.0):
+    """
+    Add deltas to the MonthlyRollup row for the month of `day` (UPSERT, caller commits).
+    Waste is attributed to the shopping event's date, same as the event totals.
+    """
+    stmt = dialect_insert()(MonthlyRollup).values(
+        year_month=month_key(day),
+        shopping_sum=shopping,
+        waste_sum=waste,
+        usage_sum=usage
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[MonthlyRollup.year_month],
+        set_={
+            'shopping_sum': MonthlyRollup.shopping_sum + stmt.excluded.shopping_sum,
+            'waste_sum': MonthlyRollup.waste_sum + stmt.excluded.waste_sum,
+            'usage_sum': MonthlyRollup.usage_sum + stmt.excluded.usage_sum
+        }
+    )
+    db.session.execute(stmt)
+
+def add_event_waste(event_id, waste_cost):
+    """
+    Add `waste_cost` to a ShoppingEvent's total_waste and its month's rollup (caller commits).
+    Done as a single atomic UPDATE ... RETURNING, so concurrent discards can't overwrite each other.
+    """
+    event_date = db.session.execute(
+        update(ShoppingEvent)
+        .where(ShoppingEvent.id == event_id)
+        .values(total_waste=ShoppingEvent.total_waste + waste_cost)
+        .returning(ShoppingEvent.date)
+    ).scalar()
+    if event_date:
+        bump_monthly_rollup(event_date, waste=waste_cost)
+
+def rebuild_monthly_rollup():
+    """Recompute all MonthlyRollup rows from ShoppingEvent and Usage (backfill/repair, caller commits)."""
+    totals = {}
+    event_rows = db.session.query(
+        ShoppingEvent.date, db.func.sum(ShoppingEvent.total_cost), db.func.sum(ShoppingEvent.total_waste)
+    ).group_by(ShoppingEvent.date).all()
+    for d, cost, waste in event_rows:
+        row = totals.setdefault(month_key(d), {'shopping_sum': 0.0, 'waste_sum': 0.0, 'usage_sum': 0.0})
+        row['shopping_sum'] += cost or 0
+        row['waste_sum'] += waste or 0
+
+    usage_rows = db.session.query(Usage.usage_date, db.func.sum(Usage.cost)).group_by(Usage.usage_date).all()
+    for d, cost in usage_rows:
+        row = totals.setdefault(month_key(d), {'shopping_sum': 0.0, 'waste_sum': 0.0, 'usage_sum': 0.0})
+        row['usage_sum'] += cost or 0
+
+    MonthlyRollup.query.delete()
+    db.session.add_all(MonthlyRollup(year_month=ym, **sums) for ym, sums in totals.items())
+
+def get_ingredient_ids():
+    """
+    Map of ingredient name -> id for the current user, loaded once and kept on `g` for the rest of the request.
+    Callers that create ingredients should add them to the returned dict.
+    """
+    if 'ingredient_ids' not in g:
+        g.ingredient_ids = dict(
+            db.session.query(Ingredient.name, Ingredient.id).filter(Ingredient.user_id == current_user.id).all()
+        )
+    return g.ingredient_ids
 
 def get_total_asset_value():
     """Calculate total value of current inventory (Cost of Goods on Hand)"""
-    purchases = Purchase.query.filter(Purchase.remaining_quantity > 0).all()
-    total = sum(p.remaining_quantity * p.cost_per_unit for p in purchases)
+    total = db.session.query(
+        db.func.sum(Purchase.remaining_quantity * Purchase.cost_per_unit)
+    ).filter(Purchase.remaining_quantity > 0).scalar() or 0.0
     return total
 
 def get_expiring_items(days=3):
     today = date.today()
     items = []
-    purchases = Purchase.query.filter(Purchase.remaining_quantity > 0).all()
+    # Expiry window is filtered in SQL; ingredient is joined so the loop below doesn't lazy-load per row
+    purchases = Purchase.query.options(joinedload(Purchase.ingredient)).filter(
+        Purchase.remaining_quantity > 0,
+        Purchase.expiry_date != None,
+        Purchase.expiry_date >= today,
+        Purchase.expiry_date <= today + timedelta(days=days)
+    ).all()
     for p in purchases:
-        if p.expiry_date:
-            delta = (p.expiry_date - today).days
-            if 0 <= delta <= days:
-                loss_val = p.remaining_quantity * p.cost_per_unit
-                items.append({
-                    'id': p.id,
-                    'name': p.ingredient.name,
-                    'days_left': delta,
-                    'potential_loss': loss_val,
-                    'qty': p.remaining_quantity,
-                    'unit': p.ingredient.standard_unit
-                })
+        delta = (p.expiry_date - today).days
+        loss_val = p.remaining_quantity * p.cost_per_unit
+        items.append({
+            'id': p.id,
+            'name': p.ingredient.name,
+            'days_left': delta,
+            'potential_loss': loss_val,
+            'qty': p.remaining_quantity,
+            'unit': p.ingredient.standard_unit
+        })
     return items
 
 # --- Routes ---
@@ -157,35 +287,19 @@ def dashboard():
     daily_cost = sum(u.cost for u in today_usages)
     
     today = date.today()
-    start_month = date(today.year, today.month, 1)
-    if today.month == 12:
-        end_month = date(today.year + 1, 1, 1)
-    else:
-        end_month = date(today.year, today.month + 1, 1)
         
-    # Monthly Shopping Total
-    monthly_shopping = db.session.query(db.func.sum(ShoppingEvent.total_cost)).filter(
-        ShoppingEvent.date >= start_month,
-        ShoppingEvent.date < end_month
-    ).scalar() or 0
-    
-    # Monthly Waste Total
-    monthly_waste = db.session.query(db.func.sum(ShoppingEvent.total_waste)).filter(
-        ShoppingEvent.date >= start_month,
-        ShoppingEvent.date < end_month
-    ).scalar() or 0
-
-    # Monthly Usage (Consumption) Total
-    monthly_usage = db.session.query(db.func.sum(Usage.cost)).filter(
-        Usage.usage_date >= start_month,
-        Usage.usage_date < end_month
-    ).scalar() or 0
+    # Monthly Shopping / Waste / Usage Totals and Cumulative Waste (All Time), in one round-trip
+    # over the pre-aggregated rollup (see bump_monthly_rollup)
+    this_month = MonthlyRollup.year_month == month_key(today)
+    monthly_shopping, monthly_waste, monthly_usage, cumulative_waste = db.session.query(
+        db.func.coalesce(db.func.sum(db.case((this_month, MonthlyRollup.shopping_sum), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((this_month, MonthlyRollup.waste_sum), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((this_month, MonthlyRollup.usage_sum), else_=0)), 0),
+        db.func.coalesce(db.func.sum(MonthlyRollup.waste_sum), 0)
+    ).one()
     
     current_month_str = f"{today.month}월"
 
-    # Cumulative Waste (All Time)
-    cumulative_waste = db.session.query(db.func.sum(ShoppingEvent.total_waste)).scalar() or 0
-
     return render_template('dashboard.html', 
                            total_asset=total_asset, 
                            monthly_shopping=monthly_shopping,
@@ -200,7 +314,11 @@ def dashboard():
 @login_required
 def inventory():
     # Show detailed active purchases (Inventory Batches)
-    purchases = Purchase.query.filter(Purchase.remaining_quantity > 0).order_by(Purchase.expiry_date.asc()).all()
+    # Only the columns inventory.html renders, with the ingredient joined in the same query
+    purchases = Purchase.query.options(
+        load_only(Purchase.id, Purchase.remaining_quantity, Purchase.cost_per_unit, Purchase.expiry_date),
+        joinedload(Purchase.ingredient).load_only(Ingredient.name, Ingredient.standard_unit)
+    ).filter(Purchase.remaining_quantity > 0).order_by(Purchase.expiry_date.asc()).all()
     return render_template('inventory.html', purchases=purchases)
 
 @app.route('/add_ingredient', methods=['POST'])
@@ -227,12 +345,14 @@ def purchase():
             # Create Event
             event = ShoppingEvent(date=p_date, place=p_place, total_cost=0, total_waste=0)
             db.session.add(event)
-            db.session.commit() # Commit to get ID
+            db.session.flush() # Flush to get ID (committed together with the purchases)
             
-            total_trip_cost = 0
+            # Parse amounts once; prices feed both the discount ratio and the per-item costs
+            prices = [float(item['price']) for item in items] # Total price for each item
+            qtys = [float(item['qty']) for item in items]
             
             # Calculate Discount Ratio
-            raw_total = sum(float(item['price']) for item in items)
+            raw_total = sum(prices)
             total_pay_input = data.get('total_pay')
             
             discount_ratio = 1.0
@@ -241,30 +361,45 @@ def purchase():
                  # Ratio = Total Pay / Raw Total
                  discount_ratio = float(total_pay_input) / raw_total
             
+            # Apply Discount Ratio to individual item prices
+            final_prices = [price * discount_ratio for price in prices]
+            total_trip_cost = sum(final_prices)
+            
+            # Find/Create Ingredients: request-cached name -> id map, one INSERT ... ON CONFLICT DO NOTHING
+            # for new ones (a concurrent request may create the same name), then one SELECT for their IDs
+            ing_ids = get_ingredient_ids()
+            missing = {}
             for item in items:
+                if item['name'] not in ing_ids:
+                    missing.setdefault(item['name'], {
+                        'name': item['name'],
+                        'category': '일반',
+                        'mode': 'precision',
+                        'standard_unit': item['unit'],
+                        'user_id': current_user.id
+                    })
+            if missing:
+                db.session.execute(
+                    dialect_insert()(Ingredient)
+                    .values(list(missing.values()))
+                    .on_conflict_do_nothing()
+                )
+                ing_ids.update(
+                    db.session.query(Ingredient.name, Ingredient.id)
+                    .filter(Ingredient.user_id == current_user.id, Ingredient.name.in_(missing.keys())).all()
+                )
+            
+            new_purchases = []
+            for item, qty, final_item_price in zip(items, qtys, final_prices):
                 name = item['name']
-                qty = float(item['qty'])
-                unit = item['unit']
-                price = float(item['price']) # Total price for this item
                 expiry_str = item.get('expiry')
                 
-                # Find/Create Ingredient
-                ing = Ingredient.query.filter_by(name=name, user_id=current_user.id).first()
-                if not ing:
-                    ing = Ingredient(name=name, category='일반', mode='precision', standard_unit=unit, user_id=current_user.id)
-                    db.session.add(ing)
-                    db.session.commit()
-                
-                # Apply Discount Ratio to individual item price
-                final_item_price = price * discount_ratio
-                
                 cost_unit = final_item_price / qty if qty > 0 else 0
-                total_trip_cost += final_item_price
                 
                 e_date = datetime.strptime(expiry_str, '%Y-%m-%d').date() if expiry_str else None
                 
-                new_p = Purchase(
-                    ingredient_id=ing.id,
+                new_purchases.append(Purchase(
+                    ingredient_id=ing_ids[name],
                     purchase_date=p_date,
                     quantity=qty,
                     remaining_quantity=qty,
@@ -272,10 +407,11 @@ def purchase():
                     expiry_date=e_date,
                     shopping_event_id=event.id,
                     status='active'
-                )
-                db.session.add(new_p)
+                ))
                 
+            db.session.bulk_save_objects(new_purchases)
             event.total_cost = total_trip_cost
+            bump_monthly_rollup(p_date, shopping=total_trip_cost)
             db.session.commit()
             return jsonify({'success': True})
             
@@ -288,7 +424,7 @@ def purchase():
 
 @app.route('/api/discard/<int:purchase_id>', methods=['POST'])
 def discard_item(purchase_id):
-    p = Purchase.query.get(purchase_id)
+    p = db.session.get(Purchase, purchase_id, with_for_update=True, options=[lazyload(Purchase.ingredient)])
     if not p:
         return jsonify({'error': 'Not found'}), 404
         
@@ -310,9 +446,7 @@ def discard_item(purchase_id):
         
     # Update Event Waste Total
     if p.shopping_event_id:
-        event = ShoppingEvent.query.get(p.shopping_event_id)
-        # Recalculate full waste for event to be safe or just add
-        event.total_waste += waste_cost
+        add_event_waste(p.shopping_event_id, waste_cost)
         
     db.session.commit()
     return jsonify({'success': True})
@@ -320,21 +454,27 @@ def discard_item(purchase_id):
 @app.route('/api/shopping_events')
 def api_shopping_events():
     # Return events for calendar
-    events = ShoppingEvent.query.all()
+    # Plain column rows (no ORM objects / identity map) since this is read-only
+    rows = db.session.execute(
+        select(ShoppingEvent.id, ShoppingEvent.date, ShoppingEvent.total_cost, ShoppingEvent.total_waste)
+    ).all()
     # Or filter by month if needed
-    data = []
-    for e in events:
-        data.append({
-            'id': e.id,
-            'date': e.date.strftime('%Y-%m-%d'),
-            'total_cost': e.total_cost,
-            'total_waste': e.total_waste
-        })
+    data = [
+        {
+            'id': r.id,
+            'date': r.date.strftime('%Y-%m-%d'),
+            'total_cost': r.total_cost,
+            'total_waste': r.total_waste
+        }
+        for r in rows
+    ]
     return jsonify(data)
 
 @app.route('/api/shopping_event_detail/<int:event_id>')
 def api_shopping_event_detail(event_id):
-    event = ShoppingEvent.query.get(event_id)
+    event = ShoppingEvent.query.options(
+        joinedload(ShoppingEvent.purchases).joinedload(Purchase.ingredient)
+    ).filter(ShoppingEvent.id == event_id).first()
     if not event: return jsonify({})
     
     items = []
@@ -360,7 +500,7 @@ def api_shopping_event_detail(event_id):
 
 @app.route('/delete_usage/<int:usage_id>', methods=['POST'])
 def delete_usage(usage_id):
-    usage = Usage.query.get(usage_id)
+    usage = db.session.get(Usage, usage_id)
     if usage:
         # Restore stock (Simplification: Add to any available batch or most recent)
         # Ideally we should know which batch it came from, but we didn't track it explicitly in Many-to-Many
@@ -370,6 +510,7 @@ def delete_usage(usage_id):
         if purchase:
             purchase.remaining_quantity += usage.actual_usage
         
+        bump_monthly_rollup(usage.usage_date, usage=-usage.cost)
         db.session.delete(usage)
         db.session.commit()
         return jsonify({'success': True})
@@ -389,21 +530,23 @@ def cook():
             
             u_date = datetime.strptime(u_date_str, '%Y-%m-%d').date()
             
+            # Resolve quantities first so FIFO can run over all items in one pass
+            unit_ratios = get_unit_ratios()
+            lines = []
             for item in items:
                 ing_id = int(item['ingredient_id'])
                 input_amount = float(item.get('amount', 0))
                 unit_name = item.get('unit_name', 'std')
                 
-                final_qty = input_amount
-                
-                # Check Unit
-                matrix = UnitMatrix.query.filter_by(unit_name=unit_name).first()
-                if matrix:
-                    final_qty = input_amount * matrix.ratio_to_standard
+                # Check Unit (unknown units, e.g. 'std', are already in standard unit)
+                final_qty = input_amount * unit_ratios.get(unit_name, 1.0)
                     
-                cost = calculate_fifo_cost(ing_id, final_qty)
+                lines.append((ing_id, input_amount, unit_name, final_qty))
                 
-                new_usage = Usage(
+            costs = calculate_fifo_cost_batch([(ing_id, final_qty) for ing_id, _, _, final_qty in lines])
+            
+            usages = [
+                Usage(
                     ingredient_id=ing_id,
                     usage_date=u_date,
                     meal_type=meal_type,
@@ -411,8 +554,12 @@ def cook():
                     actual_usage=final_qty,
                     cost=cost
                 )
-                db.session.add(new_usage)
+                for (ing_id, input_amount, unit_name, final_qty), cost in zip(lines, costs)
+            ]
+            db.session.add_all(usages)
+            bump_monthly_rollup(u_date, usage=sum(costs))
             
+            # Single commit for inventory reduction + usage records
             db.session.commit()
             return jsonify({'success': True})
 
@@ -426,13 +573,28 @@ def cook():
     ingredients = Ingredient.query.all()
     
     # Calculate estimated cost for frontend display (next available purchase)
+    # One query: rank active batches per ingredient in FIFO order and keep the first
+    ranked = db.session.query(
+        Purchase.ingredient_id,
+        Purchase.cost_per_unit,
+        db.func.row_number().over(
+            partition_by=Purchase.ingredient_id,
+            order_by=[Purchase.purchase_date.asc(), Purchase.expiry_date.asc()]
+        ).label('rn')
+    ).filter(Purchase.remaining_quantity > 0).subquery()
+    cost_map = dict(
+        db.session.query(ranked.c.ingredient_id, ranked.c.cost_per_unit).filter(ranked.c.rn == 1).all()
+    )
+    
+    # Stock on hand per ingredient, also in one query (instead of ing.purchases per row in the template)
+    stock_map = dict(
+        db.session.query(Purchase.ingredient_id, db.func.sum(Purchase.remaining_quantity))
+        .group_by(Purchase.ingredient_id).all()
+    )
+    
     for ing in ingredients:
-        next_batch = Purchase.query.filter(
-            Purchase.ingredient_id == ing.id, 
-            Purchase.remaining_quantity > 0
-        ).order_by(Purchase.purchase_date.asc(), Purchase.expiry_date.asc()).first()
-        
-        ing.estimated_cost = next_batch.cost_per_unit if next_batch else 0
+        ing.estimated_cost = cost_map.get(ing.id, 0)
+        ing.stock = stock_map.get(ing.id, 0)
 
     units = UnitMatrix.query.all()
     return render_template('kitchen.html', ingredients=ingredients, units=units, target_date=target_date)
@@ -457,43 +619,37 @@ def monthly_stats():
     else:
         end_date = date(year, month + 1, 1)
         
-    # 1. Usage Costs (Date of Consumption)
-    usages = Usage.query.filter(
+    # 1. Usage Costs (Date of Consumption), summed per day in SQL
+    usage_rows = db.session.query(Usage.usage_date, db.func.sum(Usage.cost)).filter(
         Usage.usage_date >= start_date,
         Usage.usage_date < end_date
-    ).all()
+    ).group_by(Usage.usage_date).all()
     
     # 2. Shopping Waste (Date of Shopping Event)
     # We attribute waste cost to the Shopping Event date as per plan
-    events = ShoppingEvent.query.filter(
+    waste_rows = db.session.query(ShoppingEvent.date, db.func.sum(ShoppingEvent.total_waste)).filter(
         ShoppingEvent.date >= start_date,
-        ShoppingEvent.date < end_date
-    ).all()
+        ShoppingEvent.date < end_date,
+        ShoppingEvent.total_waste > 0
+    ).group_by(ShoppingEvent.date).all()
     
-    data = {}
+    usage_by_day = {d.strftime('%Y-%m-%d'): cost for d, cost in usage_rows}
+    waste_by_day = {d.strftime('%Y-%m-%d'): waste for d, waste in waste_rows}
     
-    # Sum Usage
-    for u in usages:
-        day_str = u.usage_date.strftime('%Y-%m-%d')
-        if day_str not in data:
-            data[day_str] = {'usage': 0, 'waste': 0, 'total': 0}
-        data[day_str]['usage'] += u.cost
-        data[day_str]['total'] += u.cost
-        
-    # Sum Waste
-    for e in events:
-        day_str = e.date.strftime('%Y-%m-%d')
-        if e.total_waste > 0:
-            if day_str not in data:
-                data[day_str] = {'usage': 0, 'waste': 0, 'total': 0}
-            data[day_str]['waste'] += e.total_waste
-            data[day_str]['total'] += e.total_waste
+    data = {
+        day_str: {
+            'usage': usage_by_day.get(day_str, 0),
+            'waste': waste_by_day.get(day_str, 0),
+            'total': usage_by_day.get(day_str, 0) + waste_by_day.get(day_str, 0)
+        }
+        for day_str in usage_by_day.keys() | waste_by_day.keys()
+    }
         
     return jsonify(data)
 
 @app.route('/api/update_purchase_status/<int:purchase_id>', methods=['POST'])
 def update_purchase_status(purchase_id):
-    p = Purchase.query.get(purchase_id)
+    p = db.session.get(Purchase, purchase_id, with_for_update=True, options=[lazyload(Purchase.ingredient)])
     if not p: return jsonify({'success': False}), 404
     
     data = request.get_json()
@@ -509,8 +665,7 @@ def update_purchase_status(purchase_id):
         
         # Update Event
         if p.shopping_event_id:
-            evt = ShoppingEvent.query.get(p.shopping_event_id)
-            evt.total_waste += waste_cost
+            add_event_waste(p.shopping_event_id, waste_cost)
             
     # Note: Reverting discard is complex (how much to restore?), separate task.
     # For now support one-way or simple toggle if needed (reset if accidental?)
@@ -521,7 +676,7 @@ def update_purchase_status(purchase_id):
 @app.route('/api/daily_detail/<date_str>')
 def daily_detail(date_str):
     target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    usages = Usage.query.filter(Usage.usage_date == target_date).all()
+    usages = Usage.query.options(selectinload(Usage.ingredient)).filter(Usage.usage_date == target_date).all()
     
     # Group by meal type
     grouped = {}
@@ -537,31 +692,37 @@ def daily_detail(date_str):
             'cost': u.cost
         })
         
+    return jsonify(grouped)
+
 @app.route('/api/delete_usage/<int:usage_id>', methods=['POST'])
 def api_delete_usage(usage_id):
-    usage = Usage.query.get_or_404(usage_id)
+    usage = db.get_or_404(Usage, usage_id)
     ingredient_id = usage.ingredient_id
     qty_to_restore = usage.actual_usage
     
     # Inventory Restoration Logic (Reverse FIFO approximation)
     # We look for purchases that are not full (remaining < initial)
     # and fill them up, starting from oldest (since that's what we likely consumed from).
+    # Streamed, since we usually only refill the first batch or two; locked like the FIFO scan
     purchases = Purchase.query.filter(
         Purchase.ingredient_id == ingredient_id,
         Purchase.remaining_quantity < Purchase.quantity
-    ).order_by(Purchase.purchase_date.asc(), Purchase.expiry_date.asc()).all()
+    ).options(lazyload(Purchase.ingredient)).order_by(
+        Purchase.purchase_date.asc(), Purchase.expiry_date.asc()
+    ).with_for_update().yield_per(16)
     
     remaining_to_restore = qty_to_restore
     
-    for p in purchases:
-        if remaining_to_restore <= 0:
-            break
+    with db.session.no_autoflush:
+        for p in purchases:
+            if remaining_to_restore <= 0:
+                break
+                
+            space = p.quantity - p.remaining_quantity
+            restore_amount = min(space, remaining_to_restore)
             
-        space = p.quantity - p.remaining_quantity
-        restore_amount = min(space, remaining_to_restore)
-        
-        p.remaining_quantity += restore_amount
-        remaining_to_restore -= restore_amount
+            p.remaining_quantity += restore_amount
+            remaining_to_restore -= restore_amount
         
     # If still remaining (e.g. original purchase deleted?), add to the most recent active purchase
     # or just the most recent purchase available.
@@ -570,13 +731,26 @@ def api_delete_usage(usage_id):
         if last_purchase:
             last_purchase.remaining_quantity += remaining_to_restore
 
+    bump_monthly_rollup(usage.usage_date, usage=-usage.cost)
     db.session.delete(usage)
     db.session.commit()
     return jsonify({'success': True})
 
 
-with app.app_context():
+def init_db():
+    """
+    Create tables and indexes, seed basic units and backfill rollups.
+    Safe to run repeatedly; called once per deploy via `flask --app app init-db` instead of on every import.
+    """
     db.create_all()
+    # create_all() skips existing tables, so add any indexes introduced since they were created
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            try:
+                index.create(db.engine, checkfirst=True)
+            except SQLAlchemyError as e:
+                # e.g. a unique index over rows that already contain duplicates; don't abort the rest of init
+                app.logger.warning("Could not create index %s: %s", index.name, e)
     # Seed Basic Units if empty
     if not UnitMatrix.query.first():
         db.session.add(UnitMatrix(unit_name='큰술', ratio_to_standard=15, guide_image_url='')) # 15ml/g
@@ -588,6 +762,18 @@ with app.app_context():
              db.session.add(Ingredient(name='계란', category='유제품', standard_unit='count'))
              db.session.add(Ingredient(name='삼겹살', category='육류', standard_unit='g'))
         db.session.commit()
+    # Backfill dashboard rollups for databases created before monthly_rollup existed
+    if not MonthlyRollup.query.first():
+        rebuild_monthly_rollup()
+        db.session.commit()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create/upgrade the database schema and seed initial data."""
+    init_db()
+    click.echo('Database initialized.')
 
 if __name__ == '__main__':
+    with app.app_context():
+        init_db()
     app.run(debug=True, port=5000)
@@ -1,3 +1,4 @@
+from sqlalchemy import or_, update
 from app import app, db, UnitMatrix, Usage
 
 def run_migration():
@@ -18,19 +19,19 @@ def run_migration():
         
         db.session.commit()
         
-        # 2. Update Usages (input_unit text)
+        # 2. Update Usages (input_unit text) in a single UPDATE ... SET input_unit = REPLACE(...)
         print("Migrating Usage records...")
-        usages = Usage.query.all()
-        count = 0
-        for u in usages:
-            changed = False
-            for old_name, new_name in mappings.items():
-                if old_name in u.input_unit:
-                    u.input_unit = u.input_unit.replace(old_name, new_name)
-                    changed = True
+        new_input_unit = Usage.input_unit
+        for old_name, new_name in mappings.items():
+            new_input_unit = db.func.replace(new_input_unit, old_name, new_name)
             
-            if changed:
-                count += 1
+        result = db.session.execute(
+            update(Usage)
+            .where(or_(*(Usage.input_unit.like(f"%{old_name}%") for old_name in mappings)))
+            .values(input_unit=new_input_unit)
+            .execution_options(synchronize_session=False)
+        )
+        count = result.rowcount
                 
         db.session.commit()
         print(f"Updated {count} usage records.")
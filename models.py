@@ -2,10 +2,15 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 from datetime import datetime
 
-db = SQLAlchemy()
+# Sessions are request-scoped, so keep loaded objects usable after commit instead of re-SELECTing them
+db = SQLAlchemy(session_options={'expire_on_commit': False})
 
 class Ingredient(db.Model):
     __tablename__ = 'ingredients'
+    __table_args__ = (
+        # One ingredient per name per user; lets purchase() upsert with ON CONFLICT DO NOTHING
+        db.Index('ux_ingredients_user_name', 'user_id', 'name', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     # Link to User (Multi-tenancy) - nullable for now for migration, but ideally required
@@ -18,8 +23,9 @@ class Ingredient(db.Model):
     # Calculated fields (denormalized for performance, or calculated on fly)
     # We will calculate these dynamically for now or update them on transaction
     
-    purchases = db.relationship('Purchase', backref='ingredient', lazy=True)
-    usages = db.relationship('Usage', backref='ingredient', lazy=True)
+    # 'dynamic' so ingredient.purchases / .usages are queries that can be filtered instead of loading every row
+    purchases = db.relationship('Purchase', back_populates='ingredient', lazy='dynamic')
+    usages = db.relationship('Usage', back_populates='ingredient', lazy='dynamic')
 
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -35,15 +41,26 @@ class User(UserMixin, db.Model):
 class ShoppingEvent(db.Model):
     __tablename__ = 'shopping_events'
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
+    date = db.Column(db.Date, nullable=False, default=datetime.utcnow, index=True)
     place = db.Column(db.String(100))
     total_cost = db.Column(db.Float, default=0.0)
     total_waste = db.Column(db.Float, default=0.0)
     
-    purchases = db.relationship('Purchase', backref='shopping_event', lazy=True)
+    # Plain lazy load: api_shopping_event_detail eager-loads this explicitly when it needs it
+    purchases = db.relationship('Purchase', back_populates='shopping_event', lazy=True)
 
 class Purchase(db.Model):
     __tablename__ = 'purchases'
+    __table_args__ = (
+        # Lets active-inventory scans (remaining_quantity > 0) skip exhausted batches
+        db.Index('ix_purchases_remaining_ingredient', 'remaining_quantity', 'ingredient_id'),
+        # FIFO lookups: WHERE ingredient_id = ? AND remaining_quantity > 0 ORDER BY purchase_date, expiry_date
+        db.Index('ix_purchase_fifo', 'ingredient_id', 'remaining_quantity', 'purchase_date', 'expiry_date'),
+        # Partial index over active batches only (both Postgres and SQLite support WHERE on indexes)
+        db.Index('ix_purchase_active', 'ingredient_id', 'purchase_date',
+                 postgresql_where=db.text('remaining_quantity > 0'),
+                 sqlite_where=db.text('remaining_quantity > 0')),
+    )
     id = db.Column(db.Integer, primary_key=True)
     ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), nullable=False)
     purchase_date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
@@ -62,11 +79,16 @@ class Purchase(db.Model):
     discarded_quantity = db.Column(db.Float, default=0.0)
     discarded_cost = db.Column(db.Float, default=0.0)
 
+    # Many-to-one: joined by default (INNER JOIN, ingredient_id is NOT NULL) since almost every view shows the name
+    ingredient = db.relationship('Ingredient', back_populates='purchases', lazy='joined', innerjoin=True)
+    # Not read on any hot path, so left lazy rather than joining shopping_events into every Purchase query
+    shopping_event = db.relationship('ShoppingEvent', back_populates='purchases')
+
 class Usage(db.Model):
     __tablename__ = 'usages'
     id = db.Column(db.Integer, primary_key=True)
     ingredient_id = db.Column(db.Integer, db.ForeignKey('ingredients.id'), nullable=False)
-    usage_date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
+    usage_date = db.Column(db.Date, nullable=False, default=datetime.utcnow, index=True)
     meal_type = db.Column(db.String(50)) # Breakfast, Lunch, Dinner, Snack, Adjustment(Daily Close)
     
     input_unit = db.Column(db.String(50)) # e.g., "1 Tbsp"
@@ -74,6 +96,8 @@ class Usage(db.Model):
     
     cost = db.Column(db.Float, nullable=False) # Calculated via FIFO
 
+    ingredient = db.relationship('Ingredient', back_populates='usages', lazy='joined', innerjoin=True)
+
 class UnitMatrix(db.Model):
     __tablename__ = 'unit_matrix'
     id = db.Column(db.Integer, primary_key=True)
@@ -81,3 +105,10 @@ class UnitMatrix(db.Model):
     ratio_to_standard = db.Column(db.Float, nullable=False) # Multiplier to get g/ml
     guide_image_url = db.Column(db.String(200))
 
+class MonthlyRollup(db.Model):
+    __tablename__ = 'monthly_rollup'
+    # Denormalized per-month totals for the dashboard, kept in sync on write (see app.bump_monthly_rollup)
+    year_month = db.Column(db.String(6), primary_key=True) # e.g., "202510"
+    shopping_sum = db.Column(db.Float, nullable=False, default=0.0) # ShoppingEvent.total_cost by event date
+    waste_sum = db.Column(db.Float, nullable=False, default=0.0) # ShoppingEvent.total_waste by event date
+    usage_sum = db.Column(db.Float, nullable=False, default=0.0) # Usage.cost by usage date